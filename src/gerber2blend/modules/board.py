@@ -2,11 +2,14 @@
 
 import bmesh
 import bpy
+import itertools
 import logging
+import numpy as np
+import numpy.typing as npt
 
 from mathutils import Vector
 from os import listdir, path
-from typing import List, Tuple, Optional, cast, Iterable
+from typing import List, Tuple, Optional
 
 import gerber2blend.core.module
 import gerber2blend.modules.config as config
@@ -24,6 +27,10 @@ from gerber2blend.modules.config import (
     OUT_B_SOLDER,
 )
 from gerber2blend.modules.materials import (
+    BOARD_MATERIALS,
+    EDGE_MATERIALS,
+    SOLDER_MATERIAL,
+    load_materials,
     process_materials,
     process_edge_materials,
     clear_empty_material_slots,
@@ -57,9 +64,16 @@ def make_board() -> bpy.types.Object:
     logger.info("Generating board")
 
     all_list, layer_thickness = generate_all_layers_list()
-    logging.debug(f"Found layer list: {all_list}")
-    logging.debug(f"Thickness of layers: {layer_thickness}")
+    logging.debug("Found layer list: %s", all_list)
+    logging.debug("Thickness of layers: %s", layer_thickness)
+    # Z coordinate of the top of each layer
+    layer_offsets = list(itertools.accumulate(layer_thickness))
+    board_thickness = stk.get().thickness
+    use_stackup = config.blendcfg["EFFECTS"]["STACKUP"]
     board_col = cu.create_collection("Board")
+    # load all materials used by the board at once, so that the materials blendfile is opened only once
+    solder_materials = [SOLDER_MATERIAL] if config.blendcfg["EFFECTS"]["SOLDER"] else []
+    load_materials(EDGE_MATERIALS + BOARD_MATERIALS + solder_materials)
 
     # preparing empty parent object with verticies of PCB bbox
     bbox_mesh = bpy.data.meshes.new("PCB_BBOX")
@@ -95,27 +109,22 @@ def make_board() -> bpy.types.Object:
         config.pcbscale_gerbv,
     )
 
-    offset_to_center = Vector(
-        [
-            cu.get_bbox(pcb, "centre")[0].x,
-            cu.get_bbox(pcb, "centre")[0].y,
-            0,
-        ]
-    )  # type: ignore
+    pcb_centre = cu.get_bbox(pcb, "centre")[0]
+    offset_to_center = Vector([pcb_centre.x, pcb_centre.y, 0])  # type: ignore
 
     if config.blendcfg["EFFECTS"]["SOLDER"]:
         solder_top = prepare_solder(OUT_F_SOLDER, config.pcbscale_vtracer)
         if solder_top is not None:
             solder_top.location[0] -= pcb.dimensions[0] / 2
             solder_top.location[1] += pcb.dimensions[1] / 2
-            solder_top.location[2] += sum(layer_thickness)
+            solder_top.location[2] += layer_offsets[-1]
             solder_top.select_set(True)
             bpy.context.view_layer.objects.active = solder_top
             bpy.ops.object.transform_apply()
 
         solder_bot = prepare_solder(OUT_B_SOLDER, config.pcbscale_vtracer)
         if solder_bot is not None:
-            bpy.ops.object.select_all(action="DESELECT")
+            cu.deselect_all()
             solder_bot.location[0] -= pcb.dimensions[0] / 2
             solder_bot.location[1] += pcb.dimensions[1] / 2
             solder_bot.select_set(True)
@@ -135,7 +144,7 @@ def make_board() -> bpy.types.Object:
             solder = bpy.context.selected_objects[0]  # type:ignore
             solder.name = "Solder"
             bpy.ops.object.shade_smooth()
-            bpy.ops.object.select_all(action="DESELECT")
+            cu.deselect_all()
             clear_and_set_solder_material(solder)
 
         for obj in bpy.context.scene.objects:
@@ -175,46 +184,46 @@ def make_board() -> bpy.types.Object:
     bare_pcb_verts = cu.get_vertices(pcb.data, 4)
     if pth:
         logger.info("Cutting PTH holes in board (may take a while!).")
-        boolean_diff(pcb, pth)
-    all_pcb_verts = cu.get_vertices(pcb.data, 4)
+        # artifacts of this diff are removed later, in the same pass that extrudes the board
+        boolean_diff(pcb, pth, clean=False)
+    artifacts = find_bool_diff_artifacts(pcb.data)
+    artifacts_set = set(artifacts.tolist())
+    all_pcb_verts = [vert for i, vert in enumerate(cu.get_vertices(pcb.data, 4)) if i not in artifacts_set]
     # list of plated pcb edges vertices
     plated_pcb_verts = cu.get_verts_difference(all_pcb_verts, bare_pcb_verts)  # type: ignore
 
-    logger.debug(f"Number of verts on bare board edges: {len(bare_pcb_verts)}")
-    logger.debug(f"Number of verts on plated board edges: {len(plated_pcb_verts)}")
+    logger.debug("Number of verts on bare board edges: %d", len(bare_pcb_verts))
+    logger.debug("Number of verts on plated board edges: %d", len(plated_pcb_verts))
     cu.remove_collection(f"{GBR_EDGE_CUTS}.svg")
     cu.remove_collection(f"{GBR_PTH}.svg")
     cu.remove_collection(f"{GBR_NPTH}.svg")
     # extrude board
-    extrude_mesh(pcb, layer_thickness[0])
-    cu.recalc_normals(pcb)
+    finalize_pcb(pcb, layer_thickness[0], artifacts)
     cu.make_sharp_edges(pcb)
 
     map_pcb_to_uv(pcb)
 
     # add materials to board edges
     process_edge_materials(pcb, plated_pcb_verts, bare_pcb_verts)  # type: ignore
-    if config.blendcfg["EFFECTS"]["STACKUP"]:
+    if use_stackup:
         logger.info("Creating layers (" + str(len(all_list)) + ")")
-        z_counter = layer_thickness[0]
+        # vertex buffer of the base layer, reused to set the thickness of each layer
+        layer_coords = np.empty(len(pcb.data.vertices) * 3, dtype=np.float32)
+        pcb.data.vertices.foreach_get("co", layer_coords)
+        layer_z = layer_coords[2::3]
+        top_verts = layer_z >= 0.0001
         for i in range(len(all_list)):
-            pcb.select_set(True)
-            # now original is selected
-            bpy.ops.object.duplicate()
-            # now duplicate is selected
-            new_obj = bpy.context.selected_objects[0]  # type:ignore
-            new_obj.name = "PCB_layer" + str(i + 2)
+            # every layer gets its own copy of the mesh, as thickness and materials differ between layers
+            new_obj = bpy.data.objects.new("PCB_layer" + str(i + 2), pcb.data.copy())
             layer_width = layer_thickness[i + 1]
-            logging.debug(f"Created layer {new_obj.name} at Z={z_counter:.3f} with width={layer_width:.3f}")
+            logging.debug("Created layer %s at Z=%.3f with width=%.3f", new_obj.name, layer_offsets[i], layer_width)
             cu.link_obj_to_collection(new_obj, board_col)
             # update layer thickness
-            for vert in new_obj.data.vertices:  # type: ignore
-                if vert.co[2] >= 0.0001:
-                    vert.co[2] = layer_width
+            layer_z[top_verts] = layer_width
+            new_obj.data.vertices.foreach_set("co", layer_coords)  # type: ignore
+            new_obj.data.update()  # type: ignore
             # move layer up
-            new_obj.location.z = z_counter  # type: ignore
-            z_counter += layer_width
-            bpy.ops.object.select_all(action="DESELECT")
+            new_obj.location.z = layer_offsets[i]  # type: ignore
 
     process_materials(board_col, all_list)
 
@@ -228,24 +237,23 @@ def make_board() -> bpy.types.Object:
         + " y:"
         + str(Vector(pcb.dimensions).y)  # type: ignore
         + " z:"
-        + str(stk.get().thickness)
+        + str(board_thickness)
     )
 
     # parent to empty object (pcb_parent)
-    bpy.ops.object.select_all(action="DESELECT")
+    cu.deselect_all()
     cu.link_obj_to_collection(empty_obj, board_col)
     for obj in board_col.objects:
         obj.select_set(True)
     bpy.context.view_layer.objects.active = empty_obj  # active obj will be parent
     bpy.ops.object.parent_set(keep_transform=True)
-    bpy.ops.object.select_all(action="DESELECT")
+    cu.deselect_all()
 
     # add vertices to empty object to store BBOX of PCB (dimensions)
-    bbox_mesh.vertices.add(8)
-    for i, vert in enumerate(cu.get_bbox(pcb, "3d")):
-        bbox_mesh.vertices[i].co = vert.copy()
-        if bbox_mesh.vertices[i].co[2] >= 0.0001:
-            bbox_mesh.vertices[i].co[2] = stk.get().thickness
+    bbox_verts = np.array(cu.get_bbox(pcb, "3d"), dtype=np.float32)
+    bbox_verts[bbox_verts[:, 2] >= 0.0001, 2] = board_thickness
+    bbox_mesh.vertices.add(len(bbox_verts))
+    bbox_mesh.vertices.foreach_set("co", bbox_verts.ravel())
 
     project_col = cu.create_collection(config.PCB_name)
     for col in bpy.context.scene.collection.children:
@@ -265,7 +273,8 @@ def generate_all_layers_list() -> Tuple[List[str], List[float]]:
     Additionally, returns the thickness of each layer.
     """
     all_list: List[str] = []
-    all_layer_thickness = [stk.get().thickness]
+    stackup = stk.get()
+    all_layer_thickness = [stackup.thickness]
 
     # When stackup generation is disabled, don't need to do anything else
     if not config.blendcfg["EFFECTS"]["STACKUP"]:
@@ -290,11 +299,11 @@ def generate_all_layers_list() -> Tuple[List[str], List[float]]:
         )
     # Sandwich the inner layers between Back and Front Cu
     all_list = [f"{GBR_B_CU}.png"] + in_list + [f"{GBR_F_CU}.png"]
-    stk_data = stk.get().stackup_data
+    stk_data = stackup.stackup_data
     layer_count = len(all_list) + 1
     if not stk_data:
         # When no stackup data is provided, divide the configured PCB thickness evenly
-        all_layer_thickness = [stk.get().thickness / layer_count] * layer_count
+        all_layer_thickness = [stackup.thickness / layer_count] * layer_count
     else:
         # Find the thickness of "dielectric <N>" entries in the stackup and sort
         # based on their names. This is used as the thickness of the inner layers.
@@ -338,41 +347,47 @@ def generate_all_layers_list() -> Tuple[List[str], List[float]]:
 # board UV mapping
 
 
-def get_area_by_type(area_type: str) -> Optional[bpy.types.Area]:
-    """Get area for context override."""
-    for screen in bpy.context.workspace.screens:
-        for area in screen.areas:
-            if area.type == area_type:
-                return area
-    return None
-
-
 def map_pcb_to_uv(pcb: bpy.types.Object) -> None:
-    """PCB surfaces UV mapping function."""
-    cu.face_sel(pcb, "top")
-    bpy.ops.uv.cube_project(
-        cube_size=1.0,
-        correct_aspect=True,
-        clip_to_bounds=True,
-        scale_to_bounds=True,
-    )
+    """PCB surfaces UV mapping function.
 
-    cu.face_sel(pcb, "bot")
-    bpy.ops.uv.cube_project(
-        cube_size=1.0,
-        correct_aspect=True,
-        clip_to_bounds=True,
-        scale_to_bounds=True,
-    )
-    bpy.ops.object.mode_set(mode="OBJECT")
+    Top and bottom faces are projected onto the XY plane and scaled to the UV bounds separately,
+    which is what cube projection does for a flat, extruded board.
+    """
+    assert isinstance(pcb.data, bpy.types.Mesh)
+    mesh = pcb.data
+    uv_layer = mesh.uv_layers.active or mesh.uv_layers.new()
+
+    normals = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+    mesh.polygons.foreach_get("normal", normals)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    uv_layer.data.foreach_get("uv", uvs)
+    uv_pairs = uvs.reshape(-1, 2)
+
+    loop_xy = coords.reshape(-1, 3)[loop_verts, :2]
+    loop_normal_z = np.repeat(normals[2::3], loop_totals)
+    for side in (loop_normal_z > 0.5, loop_normal_z < -0.5):
+        if not side.any():
+            continue
+        side_xy = loop_xy[side]
+        bounds_min = side_xy.min(axis=0)
+        bounds_size = side_xy.max(axis=0) - bounds_min
+        bounds_size[bounds_size == 0] = 1.0
+        uv_pairs[side] = (side_xy - bounds_min) / bounds_size
+    uv_layer.data.foreach_set("uv", uv_pairs.ravel())
 
 
 ########################################
 # board generation
 
 
-def boolean_diff(obj: bpy.types.Object, tool: bpy.types.Object) -> None:
-    """Apply boolean diff modifier on object and remove the tool and artifacts afterwards."""
+def boolean_diff(obj: bpy.types.Object, tool: bpy.types.Object, clean: bool = True) -> None:
+    """Apply boolean diff modifier on object and remove the tool and (optionally) artifacts afterwards."""
     # define boolean operation
     bool_modifier = obj.modifiers.new(name="diff", type="BOOLEAN")
     assert isinstance(bool_modifier, bpy.types.BooleanModifier)
@@ -387,14 +402,15 @@ def boolean_diff(obj: bpy.types.Object, tool: bpy.types.Object) -> None:
     # delete tool object
     bpy.data.objects[tool.name].select_set(True)
     bpy.ops.object.delete()
-    bpy.ops.object.select_all(action="DESELECT")
-    clean_bool_diff_artifacts(obj)
+    cu.deselect_all()
+    if clean:
+        clean_bool_diff_artifacts(obj)
 
 
 def boolean_intersect(obj: bpy.types.Object, tool: bpy.types.Object) -> None:
     """Apply boolean intersect modifier on object and remove the tool afterwards."""
     # define boolean operation
-    bpy.ops.object.select_all(action="DESELECT")
+    cu.deselect_all()
     bool_modifier = obj.modifiers.new(name="intersect", type="BOOLEAN")
     assert isinstance(bool_modifier, bpy.types.BooleanModifier)
     bool_modifier.operation = "INTERSECT"
@@ -404,10 +420,10 @@ def boolean_intersect(obj: bpy.types.Object, tool: bpy.types.Object) -> None:
     bpy.context.view_layer.objects.active = obj
     bpy.ops.object.modifier_apply(modifier=bool_modifier.name)
     # delete tool object
-    bpy.ops.object.select_all(action="DESELECT")
+    cu.deselect_all()
     bpy.data.objects[tool.name].select_set(True)
     bpy.ops.object.delete()
-    bpy.ops.object.select_all(action="DESELECT")
+    cu.deselect_all()
 
 
 def clean_outline(mesh: bpy.types.Object) -> None:
@@ -419,7 +435,7 @@ def clean_outline(mesh: bpy.types.Object) -> None:
     bpy.ops.mesh.remove_doubles(threshold=0.005)
     bpy.ops.mesh.fill()
     bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
+    cu.deselect_all()
 
 
 def extrude_mesh(obj: bpy.types.Object, height: float) -> None:
@@ -431,7 +447,7 @@ def extrude_mesh(obj: bpy.types.Object, height: float) -> None:
         bpy.ops.mesh.select_all(action="SELECT")
         bpy.ops.mesh.extrude_region_move(TRANSFORM_OT_translate={"value": (0, 0, height)})
         bpy.ops.object.mode_set(mode="OBJECT")
-        bpy.ops.object.select_all(action="DESELECT")
+        cu.deselect_all()
 
 
 def import_svg(
@@ -468,7 +484,7 @@ def import_svg(
 
 def prepare_mesh(name: str, svg_path: str, clean: bool, height: float, scale: float) -> Optional[bpy.types.Object]:
     """Prepare mesh from imported curve."""
-    bpy.ops.object.select_all(action="DESELECT")
+    cu.deselect_all()
     obj = import_svg(name, svg_path, scale)
     if isinstance(obj, bpy.types.Object):
         obj.select_set(True)
@@ -518,19 +534,19 @@ def solder_single(obj: bpy.types.Object) -> None:
         bpy.ops.transform.resize(value=(scale, scale, 1.0))  # type: ignore
 
     bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
+    cu.deselect_all()
 
 
 def prepare_solder(base_name: str, scale: float) -> Optional[bpy.types.Object]:
     """Prepare Solder mesh for single board side."""
     input_file = config.svg_path + base_name + ".svg"
     input_file_fixer = config.svg_path + base_name + "_fixer.svg"
-    bpy.ops.object.select_all(action="DESELECT")
+    cu.deselect_all()
 
     col = import_svg(base_name, input_file, scale, False)
     if isinstance(col, bpy.types.Collection):
         logger.info(f"Generating {base_name} mesh (may take a while!).")
-        bpy.ops.object.select_all(action="DESELECT")
+        cu.deselect_all()
         for obj in col.objects:
             solder_single(obj)
 
@@ -550,15 +566,50 @@ def prepare_solder(base_name: str, scale: float) -> Optional[bpy.types.Object]:
     return None
 
 
+def find_bool_diff_artifacts(mesh: bpy.types.Mesh) -> npt.NDArray[np.intp]:
+    """Find indices of vertices that are not on Z=0 (those vertices are created by corrupted boolean diff operation)."""
+    # read all coordinates at once instead of walking the vertices in Python
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    return np.flatnonzero(np.abs(coords[2::3]) > 0)
+
+
 def clean_bool_diff_artifacts(pcb: bpy.types.Object) -> None:
     """Remove vertices that are not on Z=0 (those vertices are created by corrupted boolean diff operation)."""
-    bpy.ops.object.mode_set(mode="EDIT")
     assert isinstance(pcb.data, bpy.types.Mesh)
-    mesh_obj = bmesh.from_edit_mesh(pcb.data)
-    logging.debug(f"Initial count of vertices in mesh: {len(mesh_obj.verts)}")  # type:ignore
-    verts = [v for v in cast(Iterable[bmesh.types.BMVert], mesh_obj.verts) if abs(float(v.co[2])) > 0]
+    mesh = pcb.data
+    logging.debug("Initial count of vertices in mesh: %d", len(mesh.vertices))
+    corrupted = find_bool_diff_artifacts(mesh)
+    logging.debug("Number of corrupted vertices to remove: %d", len(corrupted))
+    if len(corrupted) == 0:
+        return
+    mesh_obj = bmesh.new()
+    mesh_obj.from_mesh(mesh)
+    mesh_obj.verts.ensure_lookup_table()  # type: ignore
+    verts = [mesh_obj.verts[i] for i in corrupted]
     bmesh.ops.delete(mesh_obj, geom=verts, context="VERTS")
-    bmesh.update_edit_mesh(pcb.data)
-    logging.debug(f"Number of corrupted vertices to remove: {len(verts)}")
-    logging.debug(f"Final count of vertices in mesh: {len(mesh_obj.verts)}")  # type:ignore
-    bpy.ops.object.mode_set(mode="OBJECT")
+    mesh_obj.to_mesh(mesh)
+    mesh_obj.free()
+    logging.debug("Final count of vertices in mesh: %d", len(mesh.vertices))
+
+
+def finalize_pcb(pcb: bpy.types.Object, height: float, artifacts: npt.NDArray[np.intp]) -> None:
+    """Remove boolean diff artifacts, extrude the board using specified height and recalculate normals.
+
+    All steps are done on a single BMesh, without switching to Edit mode.
+    """
+    assert isinstance(pcb.data, bpy.types.Mesh)
+    logging.debug("Number of corrupted vertices to remove: %d", len(artifacts))
+    mesh_obj = bmesh.new()
+    mesh_obj.from_mesh(pcb.data)
+    if len(artifacts):
+        mesh_obj.verts.ensure_lookup_table()  # type: ignore
+        bmesh.ops.delete(mesh_obj, geom=[mesh_obj.verts[i] for i in artifacts], context="VERTS")
+    if height > 0.0:
+        geom = mesh_obj.verts[:] + mesh_obj.edges[:] + mesh_obj.faces[:]  # type: ignore
+        extruded = bmesh.ops.extrude_face_region(mesh_obj, geom=geom)
+        extruded_verts = [elem for elem in extruded["geom"] if isinstance(elem, bmesh.types.BMVert)]
+        bmesh.ops.translate(mesh_obj, vec=Vector((0, 0, height)), verts=extruded_verts)  # type: ignore
+    bmesh.ops.recalc_face_normals(mesh_obj, faces=mesh_obj.faces[:])  # type: ignore
+    mesh_obj.to_mesh(pcb.data)
+    mesh_obj.free()
@@ -14,7 +14,5 @@ class ClearScene(gerber2blend.core.module.Module):
 
 def clear_scene() -> None:
     """Clear the current scene."""
-    for obj in bpy.data.objects:
-        bpy.data.objects.remove(obj)
-    while len(bpy.context.scene.collection.children) > 0:
-        bpy.data.collections.remove(bpy.context.scene.collection.children[0])
+    bpy.data.batch_remove(ids=list(bpy.data.objects))
+    bpy.data.batch_remove(ids=list(bpy.context.scene.collection.children))
@@ -3,9 +3,11 @@
 import bpy
 import bmesh
 import math
+import numpy as np
+import numpy.typing as npt
 from mathutils import Vector, kdtree
 import logging
-from typing import List, Tuple, Any
+from typing import List, Tuple, Any, Sequence
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +31,8 @@ def make_kd_tree(verts: List[Tuple[float]]) -> kdtree.KDTree:
 def get_verts_difference(main_set: List[Tuple[float]], remove_set: List[Tuple[float]]) -> List[Tuple[float]]:
     """Remove set of vertices from another set."""
     main_list = list(main_set)
+    if not main_list or not remove_set:
+        return main_list
     kd = make_kd_tree(main_list)
     indexes_to_remove = []
     for vert in remove_set:
@@ -41,16 +45,6 @@ def get_verts_difference(main_set: List[Tuple[float]], remove_set: List[Tuple[fl
     return main_list
 
 
-def verts_in(kd: kdtree.KDTree, add_set: List[Vector]) -> bool:
-    """Check if there are common vertices for two sets (using previously created kdtree)."""
-    for vert in add_set:
-        *_, dist = kd.find(vert)
-        if dist:
-            if dist < 0.0001:  # points in the same place
-                return True
-    return False
-
-
 def get_bbox(obj: bpy.types.Object, arg: str) -> list[Any | Vector]:
     """Get bbox of an object.
 
@@ -64,8 +58,6 @@ def get_bbox(obj: bpy.types.Object, arg: str) -> list[Any | Vector]:
         '3d' - finds 3D bounding box
 
     """
-    bpy.ops.object.select_all(action="DESELECT")
-    bpy.context.view_layer.objects.active = obj
     bbox_vert = [obj.matrix_world @ Vector(corner) for corner in obj.bound_box]  # type:ignore
     if arg == "centre":
         centre = sum(bbox_vert, Vector())  # type:ignore
@@ -79,6 +71,15 @@ def get_bbox(obj: bpy.types.Object, arg: str) -> list[Any | Vector]:
     raise RuntimeError("Incorrect bbox input argument")
 
 
+def deselect_all() -> None:
+    """Deselect all objects.
+
+    Only the selected objects are visited, which is cheaper than running the `select_all` operator.
+    """
+    for obj in bpy.context.selected_objects:
+        obj.select_set(False)
+
+
 def recalc_normals(obj: bpy.types.Object) -> None:
     """Recalculate normals in object."""
     obj.select_set(True)
@@ -87,7 +88,7 @@ def recalc_normals(obj: bpy.types.Object) -> None:
     bpy.ops.mesh.select_all(action="SELECT")
     bpy.ops.mesh.normals_make_consistent(inside=False)
     bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
+    deselect_all()
 
 
 def make_sharp_edges(obj: bpy.types.Object) -> None:
@@ -107,48 +108,43 @@ def make_sharp_edges(obj: bpy.types.Object) -> None:
                 edge.select_set(True)
     bpy.ops.mesh.mark_sharp()
     bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
+    deselect_all()
 
 
-def face_sel(obj: bpy.types.Object, pos: str, edge_verts: None | List[Tuple[float]] = None) -> None:
-    """Select faces facing specified direction (top, bottom, edge)."""
-    if edge_verts is None:
-        edge_verts = []
-    bpy.context.view_layer.objects.active = obj
-    assert isinstance(obj.data, bpy.types.Mesh)
-    mesh = obj.data
-    bpy.ops.object.mode_set(mode="EDIT")
-    bpy.ops.mesh.select_mode(type="FACE")
-    bm = bmesh.from_edit_mesh(mesh)
-    bm.faces.ensure_lookup_table()  # type: ignore
-    kd = make_kd_tree(edge_verts)
-    for face in obj.data.polygons:  # type: ignore
-        if pos == "edge":
-            # check vertical faces
-            if abs(Vector(face.normal).z) <= 0.5:  # type: ignore
-                # check if face contains vertices from list
-                face_edges = []
-                for ind in face.vertices:
-                    face_edges.append(obj.data.vertices[ind].co)
-                if verts_in(kd, face_edges):  # type: ignore
-                    bm.faces[face.index].select = True
-        elif pos == "top":
-            bm.faces[face.index].select = Vector(face.normal).z > 0.5  # type: ignore
-        elif pos == "bot":
-            bm.faces[face.index].select = Vector(face.normal).z < -0.5  # type: ignore
-        else:
-            logger.error("Specify pos")
-    bmesh.update_edit_mesh(mesh)  # type: ignore
-
-
-def face_desel(obj: bpy.types.Object) -> None:
-    """Deselect all faces."""
-    mesh = obj.data
-    bpy.ops.object.mode_set(mode="EDIT")
-    bm = bmesh.from_edit_mesh(mesh)  # type: ignore
-    bm.faces.ensure_lookup_table()  # type: ignore
-    for face in obj.data.polygons:  # type: ignore
-        bm.faces[face.index].select = False
+def faces_facing(
+    mesh: bpy.types.Mesh, pos: str, edge_verts: Sequence[Tuple[float]] = (), precision: int = 4
+) -> npt.NDArray[np.int_]:
+    """Return indices of faces facing specified direction (top, bottom, edge).
+
+    Works in Object Mode. Edge faces are matched against `edge_verts`, which must be rounded
+    to `precision` (see get_vertices()).
+    """
+    normals = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+    mesh.polygons.foreach_get("normal", normals)
+    normals_z = normals[2::3]
+    if pos == "edge":
+        edge_set = frozenset(edge_verts)
+        if not edge_set or not len(mesh.polygons):
+            # no face can match, skip reading mesh vertices
+            return np.empty(0, dtype=np.int_)
+        # mark mesh vertices from list, rounded the same way as in get_vertices()
+        verts_in_set = np.fromiter(
+            (vert in edge_set for vert in get_vertices(mesh, precision)), dtype=bool, count=len(mesh.vertices)
+        )
+        loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loop_verts)
+        loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get("loop_start", loop_starts)
+        # faces containing any vertex from list, reduced over each face's loops
+        faces_in_set = np.logical_or.reduceat(verts_in_set[loop_verts], loop_starts)
+        # check vertical faces that contain vertices from list
+        return np.flatnonzero((np.abs(normals_z) <= 0.5) & faces_in_set)
+    if pos == "top":
+        return np.flatnonzero(normals_z > 0.5)
+    if pos == "bot":
+        return np.flatnonzero(normals_z < -0.5)
+    logger.error("Specify pos")
+    return np.empty(0, dtype=np.int_)
 
 
 def create_collection(name: str) -> Any:
@@ -1,7 +1,8 @@
 """Module performing input/output operations on files."""
 
 import bpy
-from os import listdir
+import functools
+from os import scandir
 import logging
 import gerber2blend.modules.config as config
 from pathlib import Path
@@ -25,19 +26,27 @@ def touch(file_path: str) -> None:
         pass
 
 
+@functools.lru_cache(maxsize=4)
 def read_pcb_name_from_prj(path: str, extension: str) -> str:
     """Try reading the PCB name from a project file at `path` using extension specified in config.
 
     This function will fail and throw a `RuntimeError` if `path` is
-    not a valid project directory.
+    not a valid project directory. Found names are cached, so the directory is only scanned once.
     """
-    files = listdir(path)
-    project_file = [f for f in files if f.endswith(extension)]
+    project_file: List[str] = []
+    with scandir(path) as it:
+        for entry in it:
+            if entry.name.endswith(extension):
+                project_file.append(entry.name)
+                # no need to scan further, the project is already ambiguous
+                if len(project_file) > 1:
+                    break
 
     if len(project_file) != 1:
         logger.error(f"There should be only one {extension} file in project main directory!")
         logger.error("Found: " + repr(project_file))
-        raise RuntimeError(f"Expected single {extension} file in current directory, got %d" % len(project_file))
+        count = "none" if not project_file else "more than one"
+        raise RuntimeError(f"Expected single {extension} file in current directory, got {count}")
 
     name = Path(project_file[0]).stem
     logger.debug("PCB name: %s", name)
@@ -70,7 +79,7 @@ def import_from_blendfile(
         with bpy.data.libraries.load(blendfile) as (data_from, data_to):
             filtered_data = list(filter(filter_func, getattr(data_from, data_type)))
             setattr(data_to, data_type, filtered_data)
-            logger.debug("found data " + data_type + " in file " + blendfile)
+            logger.debug("found data %s in file %s", data_type, blendfile)
             return filtered_data
     except Exception:
         logger.error("failed to open blend file " + blendfile)
@@ -85,7 +94,7 @@ def get_data_from_blendfile(
     try:
         with bpy.data.libraries.load(blendfile) as (data_from, data_to):
             result = list(filter(filter_func, getattr(data_from, data_type)))
-            logger.debug("found data " + data_type + " in file " + blendfile)
+            logger.debug("found data %s in file %s", data_type, blendfile)
     except Exception:
         logger.error("failed to open blend file " + blendfile)
     return result
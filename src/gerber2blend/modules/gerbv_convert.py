@@ -3,12 +3,18 @@
 import os
 import re
 import shutil
+import subprocess
 import logging
+import fnmatch
 import glob
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import partial
+import multiprocessing.pool
 from multiprocessing import Pool
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
+import numpy as np
 from wand.image import Image  # type: ignore
 from wand.color import Color  # type: ignore
 import vtracer  # type: ignore
@@ -47,13 +53,12 @@ TMP_F_SILKS = "tmp_fsilks"
 TMP_B_SILKS = "tmp_bsilks"
 TMP_F_MASK = "tmp_fmask"
 TMP_B_MASK = "tmp_bmask"
-TMP_F_MASK_SILKS = "tmp_fmask_for_silk"  # negated mask for silk cutout
-TMP_B_MASK_SILKS = "tmp_bmask_for_silk"  # negated mask for silk cutout
 MASK_BG_COLOR = "#aaaaaa"
 MASK_FG_COLOR = "#ffffff"
 MASK_FG_COLOR_ALPHA = "#ffffff99"
-TMP_ALPHAW_PTH = "alphaw-PTH-drl"
-TMP_ALPHAW_NPTH = "alphaw-NPTH-drl"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# layers exported transparent along each gerbv conversion to keep the same size of all outputs
+GERBV_SIZE_LAYERS = [GBR_F_MASK, GBR_B_MASK, GBR_F_FAB, GBR_B_FAB, GBR_F_SILK, GBR_B_SILK, GBR_EDGE_CUTS]
 
 logger = logging.getLogger(__name__)
 
@@ -64,11 +69,13 @@ class GerbConvert(gerber2blend.core.module.Module):
     def execute(self) -> None:
         """Run the module."""
         do_prepare_build_directory()
-        do_convert_layer_to_png()
-        do_generate_displacement_map_foundation()
-        do_crop_pngs()
-        prepare_solder()
-        do_convert_gerb_to_svg()
+        # A single worker pool is shared by all parallel phases
+        with Pool() as pool:
+            do_convert_layer_to_png(pool)
+            do_generate_displacement_map_foundation(pool)
+            do_crop_pngs(pool)
+            prepare_solder()
+            do_convert_gerb_to_svg(pool)
         do_generate_displacement_maps()
 
 
@@ -121,19 +128,26 @@ def do_prepare_build_directory() -> None:
     # Check all of the filenames specified in "GERBER_FILENAMES" and
     # move them to the build directory under the above specified names.
     gerbers_missing = False
+    # (source, destination) pairs of gerbers to copy, copied together once all inputs are resolved
+    copy_pairs: List[Tuple[str, str]] = []
     gbr_dir = config.blendcfg["SETTINGS"]["FAB_DIR"]
+    # List the fabrication data directory once and match all patterns against this listing.
+    # If the directory is missing, the required gerbers are reported as missing below.
+    fab_files: List[str] = []
+    if os.path.isdir(config.fab_path):
+        with os.scandir(config.fab_path) as it:
+            fab_files = [entry.name for entry in it if entry.is_file()]
     for k, v in config.blendcfg["GERBER_FILENAMES"].items():
         if v is None:
             # Only makes sense to do this with singular gerber files
             if k not in gerbs_with_many_files:
-                new_path = config.gbr_path + gerb_file_renames[k] + ".gbr"
+                new_path = os.path.join(config.gbr_path, f"{gerb_file_renames[k]}.gbr")
                 logger.info("Gerber file %s missing. Replacing with empty file: %s", k, new_path)
                 fio.touch(new_path)
             continue
 
         logger.info("Looking up %s in %s..", v, config.fab_path)
-        fpath = os.path.join(config.fab_path, v)
-        matches = glob.glob(fpath)
+        matches = match_files(config.fab_path, fab_files, v)
         if len(matches) == 0:
             if gerber2blend.core.blendcfg.CONFIGURATION_SCHEMA["GERBER_FILENAMES"][k].optional:
                 logger.warning(f"Did not find optional {k} in path: {config.fab_path}")
@@ -179,24 +193,26 @@ def do_prepare_build_directory() -> None:
                 gerbers_missing = True
             for i in range(0, len(matches)):
                 gerber_path = matches[i]
-                new_name = gerb_file_renames[k] + str(i) + ".gbr"
-                new_path = config.gbr_path + new_name
+                new_path = os.path.join(config.gbr_path, f"{gerb_file_renames[k]}{i}.gbr")
                 logger.info("Found %s%d: %s, saving as: %s", k, i, gerber_path, new_path)
-                shutil.copy(gerber_path, new_path)
+                copy_pairs.append((gerber_path, new_path))
             continue
 
         gerber_path = matches[0]
-        new_name = gerb_file_renames[k] + ".gbr"
-        new_path = config.gbr_path + new_name
+        new_path = os.path.join(config.gbr_path, f"{gerb_file_renames[k]}.gbr")
 
         logger.info("Found %s: %s, saving as: %s", k, gerber_path, new_path)
-        shutil.copy(gerber_path, new_path)
+        copy_pairs.append((gerber_path, new_path))
+
+    # Copies are independent I/O, which releases the GIL, so run them on threads
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda pair: shutil.copyfile(*pair), copy_pairs))
 
     if gerbers_missing:
         raise RuntimeError(f"One or more mandatory Gerber files are missing from the {gbr_dir}/ directory.")
 
 
-def do_convert_gerb_to_svg() -> None:
+def do_convert_gerb_to_svg(pool: multiprocessing.pool.Pool) -> None:
     """Convert required gerb files to SVG."""
     # Convert GBR to SVG, parallelly
     logger.info("Converting GBR to SVG files. ")
@@ -205,25 +221,19 @@ def do_convert_gerb_to_svg() -> None:
         files_for_svg.append(GBR_PTH)
     if os.path.exists(os.path.join(config.gbr_path, GBR_NPTH + ".gbr")):
         files_for_svg.append(GBR_NPTH)
-    with Pool() as p:
-        p.map(partial(gbr_to_svg_convert), files_for_svg)
+    pool.map(partial(gbr_to_svg_convert), files_for_svg)
 
     logger.info("Post-processing SVG files. ")
     # Get edge cuts SVG dimensions
     edge_svg_dimensions_data = ""
     with open(f"{config.svg_path}{GBR_EDGE_CUTS}.svg", "rt") as handle:
-        svg_data = handle.read().split("\n")
-        edge_svg_dimensions_data = svg_data[1]
+        # only the second line (svg element with dimensions) is needed
+        handle.readline()
+        edge_svg_dimensions_data = handle.readline().rstrip("\n")
     # Remove frame from layers and possible edge cuts (when edges cross with holes)
-    map_input_list = [GBR_EDGE_CUTS, GBR_PTH, GBR_NPTH]
-    with Pool() as p:
-        p.map(
-            partial(
-                correct_frame_in_svg,
-                frame=edge_svg_dimensions_data,
-            ),
-            map_input_list,
-        )
+    # Only the converted SVGs are processed. This is a few small text rewrites, so no worker pool is used.
+    for file in files_for_svg:
+        correct_frame_in_svg(file, frame=edge_svg_dimensions_data)
 
     if config.blendcfg["SETTINGS"]["USE_INKSCAPE"]:
         logger.info("Processing SVG files with Inkscape.")
@@ -231,16 +241,15 @@ def do_convert_gerb_to_svg() -> None:
         inkscape_path_union(f"{config.svg_path}{GBR_NPTH}.svg")
 
 
-def do_generate_displacement_map_foundation() -> None:
+def do_generate_displacement_map_foundation(pool: multiprocessing.pool.Pool) -> None:
     """Generate the displacement map foundation."""
     logger.info("Generating top and bottom displacement map foundation... ")
     map_input_list = [OUT_F_DISPMAP, OUT_B_DISPMAP]
 
-    with Pool() as p:
-        p.map(partial(generate_displacement_map_png), map_input_list)
+    pool.map(partial(generate_displacement_map_png), map_input_list)
 
 
-def do_convert_layer_to_png() -> None:
+def do_convert_layer_to_png(pool: multiprocessing.pool.Pool) -> None:
     """Convert required layer gerber files to PNGs."""
     logger.info("Converting all layers to PNG. ")
 
@@ -256,11 +265,10 @@ def do_convert_layer_to_png() -> None:
         ]
     )
 
-    with Pool() as p:
-        p.map(partial(gbr_png_convert), map_input_list)
+    pool.map(partial(gbr_png_convert), map_input_list)
 
 
-def do_crop_pngs() -> None:
+def do_crop_pngs(pool: multiprocessing.pool.Pool) -> None:
     """Crop generated PNGs based on trim data generated from edge cuts."""
     logger.info("Cropping all pngs. ")
 
@@ -275,54 +283,64 @@ def do_crop_pngs() -> None:
     )
 
     map_input_list = [file for file in os.listdir(config.png_path) if os.path.isfile(config.png_path + file)]
-    for file in map_input_list:
-        crop_png(file, crop_offset)
+    pool.map(partial(crop_png, crop_offset=crop_offset), map_input_list)
 
 
 def do_generate_displacement_maps() -> None:
-    """Generate the displacement maps."""
+    """Generate the displacement maps.
+
+    Intermediate images are kept in memory instead of being saved. Each one is decoded when it is needed
+    and closed once it is joined onto the displacement map, so only a few images are held at once.
+    """
     logger.info("Building displacement maps.")
+    generate_displacement_map(TMP_F_MASK, TMP_F_SILKS, OUT_F_DISPMAP)
+    generate_displacement_map(TMP_B_MASK, TMP_B_SILKS, OUT_B_DISPMAP)
+
+
+def generate_displacement_map(mask: str, silks: str, dispmap: str) -> None:
+    """Put silks, mask and holes of one board side on its displacement map and blur it."""
+    with open_png(dispmap) as dispmap_png:
+        if dispmap_png is None:
+            raise RuntimeError(f"Missing {dispmap} PNG required to build displacement map")
+        dispmap_png.background_color = Color("transparent")
 
-    # Prepare transparent holes pngs
-    copy_file(config.png_path, config.png_path, GBR_PTH + ".png", TMP_ALPHAW_PTH + ".png")
-    copy_file(config.png_path, config.png_path, GBR_NPTH + ".png", TMP_ALPHAW_NPTH + ".png")
-    wand_operation(TMP_ALPHAW_PTH, fuzz=75, transparency="white", blur=[1, 2])
-    wand_operation(TMP_ALPHAW_NPTH, fuzz=75, transparency="white", blur=[1, 2])
+        with open_png(silks) as silks_png:
+            if silks_png is None:
+                raise RuntimeError(f"Missing {silks} PNG required to build displacement map")
 
-    # Adding blur to dispmap
-    wand_operation(OUT_F_DISPMAP, out_file=OUT_F_DISPMAP)
-    wand_operation(OUT_B_DISPMAP, out_file=OUT_B_DISPMAP)
+            # Prepare transparent mask image for silk cutout
+            with open_png(mask) as mask_silks_png:
+                wand_operation(mask_silks_png, transparency=MASK_BG_COLOR, fuzz=15)
 
-    # Prepare transparent masks pngs for silk cutout
-    wand_operation(TMP_F_MASK, out_file=TMP_F_MASK_SILKS, transparency=MASK_BG_COLOR, fuzz=15)
-    wand_operation(TMP_B_MASK, out_file=TMP_B_MASK_SILKS, transparency=MASK_BG_COLOR, fuzz=15)
+                # Prepare transparent silks image + set silks alpha
+                prepare_silks(silks_png, mask=mask_silks_png)
+            add_png(dispmap_png, silks_png)
 
-    # Prepare transparent masks pngs
-    wand_operation(TMP_F_MASK, out_file=TMP_F_MASK, transparency=MASK_FG_COLOR, fuzz=20)
-    wand_operation(TMP_B_MASK, out_file=TMP_B_MASK, transparency=MASK_FG_COLOR, fuzz=20)
-    wand_operation(TMP_F_MASK, out_file=TMP_F_MASK, transparency=MASK_BG_COLOR, alpha=0.3, fuzz=20)
-    wand_operation(TMP_B_MASK, out_file=TMP_B_MASK, transparency=MASK_BG_COLOR, alpha=0.3, fuzz=20)
+        # Prepare transparent mask image
+        with open_png(mask) as mask_png:
+            wand_operation(mask_png, transparency=MASK_FG_COLOR, fuzz=20)
+            wand_operation(mask_png, transparency=MASK_BG_COLOR, alpha=0.3, fuzz=20)
+            add_png(dispmap_png, mask_png)
 
-    # Prepare transparent silks pngs + set silks alpha
-    prepare_silks(TMP_F_SILKS, out_file=TMP_F_SILKS, mask=TMP_F_MASK_SILKS)
-    prepare_silks(TMP_B_SILKS, out_file=TMP_B_SILKS, mask=TMP_B_MASK_SILKS)
+        # Prepare transparent holes images
+        for hole in [GBR_PTH, GBR_NPTH]:
+            with open_png(hole) as hole_png:
+                wand_operation(hole_png, fuzz=75, transparency="white", blur=[1, 2])
+                add_png(dispmap_png, hole_png)
 
-    # Put silks on dispmap
-    png_list = [TMP_F_SILKS, TMP_F_MASK, TMP_ALPHAW_PTH, TMP_ALPHAW_NPTH]
-    add_pngs(OUT_F_DISPMAP, png_list, out_file=OUT_F_DISPMAP)
-    png_list = [TMP_B_SILKS, TMP_B_MASK, TMP_ALPHAW_PTH, TMP_ALPHAW_NPTH]
-    add_pngs(OUT_B_DISPMAP, png_list, out_file=OUT_B_DISPMAP)
-    wand_operation(OUT_F_DISPMAP, out_file=OUT_F_DISPMAP, blur=[0, 2])
-    wand_operation(OUT_B_DISPMAP, out_file=OUT_B_DISPMAP, blur=[0, 2])
+        # Blur dispmap
+        dispmap_png.blur(0, 2)
+        dispmap_png.save(filename=config.png_path + dispmap + ".png")
 
 
 def get_gerbers_to_convert_to_png() -> List[str]:
     """Get a list of .gbr files that need to be converted to PNG."""
     # Prepare data to convert GBR -> SVG
     files_names_list = list()  # list of gbr files to convert;
-    for file in os.listdir(config.gbr_path):
-        if os.path.isfile(config.gbr_path + file):
-            files_names_list.append(file.replace(".gbr", ""))
+    with os.scandir(config.gbr_path) as it:
+        for entry in it:
+            if entry.is_file():
+                files_names_list.append(entry.name.replace(".gbr", ""))
 
     # Check if all important data are present
     if GBR_EDGE_CUTS not in files_names_list:
@@ -345,15 +363,11 @@ def gbr_png_convert(data: Tuple[str, str, str, str]) -> None:
 
     bg_color = data[2]
     fg_color = data[3]
-    fg = "--foreground"
     # All data are present in gerbv convert function to ensure the same size of all converted PNGs
-    rc = os.system(
-        f"gerbv '{in_gbr_file_path}' --background={bg_color} {fg}={fg_color} \
-        '{gbr_path}{GBR_F_MASK}.gbr' {fg}={HEX_BLACK_ALPHA} '{gbr_path}{GBR_B_MASK}.gbr' {fg}={HEX_BLACK_ALPHA} \
-        '{gbr_path}{GBR_F_FAB}.gbr' {fg}={HEX_BLACK_ALPHA} '{gbr_path}{GBR_B_FAB}.gbr' {fg}={HEX_BLACK_ALPHA} \
-        '{gbr_path}{GBR_F_SILK}.gbr' {fg}={HEX_BLACK_ALPHA} '{gbr_path}{GBR_B_SILK}.gbr' {fg}={HEX_BLACK_ALPHA} \
-        '{gbr_path}{GBR_EDGE_CUTS}.gbr' {fg}={HEX_BLACK_ALPHA} \
-        -o '{png_path}' --dpi={config.blendcfg['SETTINGS']['DPI']} -a --export=png 2>/dev/null"
+    rc = run_quiet(
+        ["gerbv", in_gbr_file_path, f"--background={bg_color}", f"--foreground={fg_color}"]
+        + gerbv_size_layers_args(gbr_path)
+        + ["-o", png_path, f"--dpi={config.blendcfg['SETTINGS']['DPI']}", "-a", "--export=png"]
     )
     if rc != 0:
         raise RuntimeError(f"Failed to convert Gerbers to PNG: gerbv returned exit code {rc}")
@@ -364,21 +378,62 @@ def generate_displacement_map_png(filename: str) -> None:
     gbr_path = config.gbr_path
     png_path = os.path.join(config.png_path, filename + ".png")
     side = filename[0]  # first letter from png name
-    fg = "--foreground"
-    rc = os.system(
-        f"gerbv '{gbr_path}{GBR_PTH}.gbr' --background=#555555 {fg}=#000000ff \
-        '{gbr_path}{GBR_NPTH}.gbr' {fg}=#000000ff \
-        '{gbr_path}{side}_Cu.gbr' {fg}=#808080ff \
-        '{gbr_path}{GBR_F_MASK}.gbr' {fg}={HEX_BLACK_ALPHA} '{gbr_path}{GBR_B_MASK}.gbr' {fg}={HEX_BLACK_ALPHA} \
-        '{gbr_path}{GBR_F_FAB}.gbr' {fg}={HEX_BLACK_ALPHA} '{gbr_path}{GBR_B_FAB}.gbr' {fg}={HEX_BLACK_ALPHA} \
-        '{gbr_path}{GBR_F_SILK}.gbr' {fg}={HEX_BLACK_ALPHA} '{gbr_path}{GBR_B_SILK}.gbr' {fg}={HEX_BLACK_ALPHA} \
-        '{gbr_path}{GBR_EDGE_CUTS}.gbr' {fg}={HEX_BLACK_ALPHA} \
-        -o '{png_path}' -a --dpi={config.blendcfg['SETTINGS']['DPI']} --export=png 2> /dev/null"
+    rc = run_quiet(
+        [
+            "gerbv",
+            f"{gbr_path}{GBR_PTH}.gbr",
+            "--background=#555555",
+            "--foreground=#000000ff",
+            f"{gbr_path}{GBR_NPTH}.gbr",
+            "--foreground=#000000ff",
+            f"{gbr_path}{side}_Cu.gbr",
+            "--foreground=#808080ff",
+        ]
+        + gerbv_size_layers_args(gbr_path)
+        + ["-o", png_path, "-a", f"--dpi={config.blendcfg['SETTINGS']['DPI']}", "--export=png"]
     )
     if rc != 0:
         raise RuntimeError(f"Failed to generate displacement map: gerbv returned exit code {rc}")
 
 
+def gerbv_size_layers_args(gbr_path: str) -> List[str]:
+    """Get gerbv arguments for transparent layers that keep the same size of all exported images."""
+    args = []
+    for layer in GERBV_SIZE_LAYERS:
+        args += [f"{gbr_path}{layer}.gbr", f"--foreground={HEX_BLACK_ALPHA}"]
+    return args
+
+
+def run_command(args: List[str], stderr: None | int = None) -> int:
+    """Run command without a shell. Returns exit code of the command.
+
+    Wraps a missing executable with a nicer error exception.
+    """
+    try:
+        return subprocess.run(args, stderr=stderr).returncode
+    except FileNotFoundError as e:
+        raise RuntimeError(f"Could not run {args[0]}, make sure it is installed and in PATH: {repr(e)}") from e
+
+
+def run_quiet(args: List[str]) -> int:
+    """Run command without a shell, discarding its error output. Returns exit code of the command."""
+    return run_command(args, stderr=subprocess.DEVNULL)
+
+
+def match_files(path: str, file_names: List[str], pattern: str) -> List[str]:
+    """Match a glob pattern against names of files found in `path`.
+
+    Returns full paths of matching files. Hidden files are skipped unless the pattern
+    starts with a dot, same as in glob. Patterns that contain directories are
+    resolved with glob directly.
+    """
+    if os.path.dirname(pattern):
+        return glob.glob(os.path.join(path, pattern))
+    if not pattern.startswith("."):
+        file_names = [name for name in file_names if not name.startswith(".")]
+    return [os.path.join(path, name) for name in fnmatch.filter(file_names, pattern)]
+
+
 def mkdir(path: str) -> None:
     """Create a directory at the specified path.
 
@@ -390,18 +445,17 @@ def mkdir(path: str) -> None:
         raise RuntimeError(f"Could not create folder at path {path}: {repr(e)}") from e
 
 
-def copy_file(path: str, new_path: str, old_file_name: str, new_file_name: str) -> None:
-    """Copy file from on path to other path with new name."""
-    if os.path.exists(path + old_file_name):
-        shutil.copy(path + old_file_name, new_path + new_file_name)
-        os.sync()
-
-
 def remove_files_with_ext(path: str, ext: str) -> None:
     """Remove files with given extension from given path."""
-    file_list = [file for file in os.listdir(path) if file.endswith(ext)]
-    for file in file_list:
-        os.remove(path + file)
+    # unlink relative to an open directory descriptor, so the path is not resolved again for every file
+    dir_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        with os.scandir(dir_fd) as it:
+            file_list = [entry.name for entry in it if entry.name.endswith(ext)]
+        for file in file_list:
+            os.unlink(file, dir_fd=dir_fd)
+    finally:
+        os.close(dir_fd)
 
 
 def gbr_to_svg_convert(file_name: str) -> None:
@@ -414,10 +468,18 @@ def gbr_to_svg_convert(file_name: str) -> None:
     if not os.path.isfile(gbr_file_path):
         raise RuntimeError(f"Gerber file {gbr_file_path} does not exist!")
 
-    gerbv_command = f"gerbv '{gbr_file_path}' --foreground={HEX_BLACK} \
-    '{gbr_path}{GBR_EDGE_CUTS}.gbr' --foreground={HEX_WHITE} \
-    -o '{svg_file_path}' --export=svg 2>/dev/null"
-    rc = os.system(gerbv_command)
+    rc = run_quiet(
+        [
+            "gerbv",
+            gbr_file_path,
+            f"--foreground={HEX_BLACK}",
+            f"{gbr_path}{GBR_EDGE_CUTS}.gbr",
+            f"--foreground={HEX_WHITE}",
+            "-o",
+            svg_file_path,
+            "--export=svg",
+        ]
+    )
     if rc != 0:
         raise RuntimeError(f"Failed to convert Gerbers to SVG: gerbv returned exit code {rc}")
 
@@ -432,16 +494,21 @@ def correct_frame_in_svg(data: str, frame: str) -> None:
     file_path = config.svg_path + data + ".svg"
     if not os.path.exists(file_path):
         return
-    with open(file_path, "rt") as handle:
-        svg_data = handle.read().split("\n")
-
-    if len(svg_data) < 2:
+    tmp_file_path = file_path + ".tmp"
+    # stream the file line by line instead of loading the whole SVG into memory
+    with open(file_path, "rt", newline="") as handle, open(tmp_file_path, "wt", newline="") as out_handle:
+        frame_replaced = False
+        for i, line in enumerate(handle):
+            if i == 1:
+                line = frame + ("\n" if line.endswith("\n") else "")
+                frame_replaced = True
+            if "rgb(100%,100%,100%)" not in line:
+                out_handle.write(line)
+
+    if not frame_replaced:
+        os.remove(tmp_file_path)
         return
-
-    svg_data[1] = frame
-    corrected_svg = [line for line in svg_data if "rgb(100%,100%,100%)" not in line]
-    with open(file_path, "wt") as handle:
-        handle.write("\n".join(corrected_svg))
+    os.replace(tmp_file_path, file_path)
 
 
 def inkscape_path_union(file_path: str) -> None:
@@ -449,7 +516,7 @@ def inkscape_path_union(file_path: str) -> None:
     if not os.path.exists(file_path):
         return
     inkscape_actions = "select-all;object-stroke-to-path;path-union;"
-    rc = os.system(f'inkscape --actions="{inkscape_actions}export-filename:{file_path};export-do" "{file_path}"')
+    rc = run_command(["inkscape", f"--actions={inkscape_actions}export-filename:{file_path};export-do", file_path])
 
     if rc != 0:
         raise RuntimeError(f"Failed to generate path union: inkscape returned exit code {rc}")
@@ -460,12 +527,19 @@ def get_edge_trim_data() -> List[int]:
     with Image(filename=os.path.join(config.png_path, GBR_EDGE_CUTS + ".png")) as edge_cuts_png:
         edge_cuts_png.trim(percent_background=0.98)
 
-        count_edge = 0
-        for i in range(edge_cuts_png.width):
-            pix = edge_cuts_png[i, int(edge_cuts_png.height / 2)]
-            if pix == Color("white"):
-                break
-            count_edge += 1
+        # count pixels up to the first white one in the middle row
+        row = np.array(
+            edge_cuts_png.export_pixels(
+                y=int(edge_cuts_png.height / 2),
+                width=edge_cuts_png.width,
+                height=1,
+                channel_map="RGBA",
+                storage="char",
+            ),
+            dtype=np.uint8,
+        ).reshape(-1, 4)
+        white_pixels = np.flatnonzero(np.all(row == 255, axis=1))
+        count_edge = int(white_pixels[0]) if len(white_pixels) else edge_cuts_png.width
 
         shave_offset = int(count_edge / 2)
         return [
@@ -480,16 +554,13 @@ def crop_png(file: str, crop_offset: List[int]) -> None:
     """Crop PNG using calculated offset."""
     image_path = os.path.join(config.png_path, file)
 
+    # check size from the PNG header first, so images that are not cropped are never decoded
+    size = read_png_size(image_path)
+    if size is not None and not crop_fits(size[0], size[1], crop_offset):
+        return
+
     with Image(filename=image_path) as png:
-        image_width = png.width
-        image_height = png.height
-        if image_width < crop_offset[0] + crop_offset[2]:
-            logger.warn("%d", crop_offset[0] + crop_offset[2])
-            logger.warn("Image to crop is thinner than given crop values.")
-            return
-        if image_height < crop_offset[1] + crop_offset[3]:
-            logger.warn("%d", crop_offset[1] + crop_offset[3])
-            logger.warn("Image to crop is higher than given crop values.")
+        if size is None and not crop_fits(png.width, png.height, crop_offset):
             return
 
         png.crop(
@@ -501,64 +572,85 @@ def crop_png(file: str, crop_offset: List[int]) -> None:
         png.save(filename=image_path)
 
 
+def crop_fits(image_width: int, image_height: int, crop_offset: List[int]) -> bool:
+    """Check if image is large enough to be cropped with given offset."""
+    if image_width < crop_offset[0] + crop_offset[2]:
+        logger.warn("%d", crop_offset[0] + crop_offset[2])
+        logger.warn("Image to crop is thinner than given crop values.")
+        return False
+    if image_height < crop_offset[1] + crop_offset[3]:
+        logger.warn("%d", crop_offset[1] + crop_offset[3])
+        logger.warn("Image to crop is higher than given crop values.")
+        return False
+    return True
+
+
+def read_png_size(image_path: str) -> None | Tuple[int, int]:
+    """Read width and height from the PNG IHDR chunk without decoding the image.
+
+    Returns None if the file is not a PNG.
+    """
+    with open(image_path, "rb") as handle:
+        # signature (8) + IHDR length (4) + "IHDR" (4) + width (4) + height (4)
+        header = handle.read(24)
+    if len(header) < 24 or header[:8] != PNG_SIGNATURE or header[12:16] != b"IHDR":
+        return None
+    return int.from_bytes(header[16:20], "big"), int.from_bytes(header[20:24], "big")
+
+
+@contextmanager
+def open_png(file: str) -> Iterator[None | Image]:
+    """Decode PNG from the PNG directory and close it on exit. Gives None if the file is missing."""
+    image_path = config.png_path + file + ".png"
+    if not os.path.exists(image_path):
+        yield None
+        return
+    with Image(filename=image_path) as png:
+        yield png
+
+
 def wand_operation(
-    in_file: str,
-    out_file: str = "",
+    png: None | Image,
     fuzz: int = 0,
     transparency: str = "",
     alpha: float = 0.0,
     blur: None | List[int] = None,
 ) -> None:
-    """Imagemagick-like operation."""
-    image_path = config.png_path + in_file + ".png"
-    if not os.path.exists(image_path):
+    """Imagemagick-like operation, done in place."""
+    if png is None:
         return
-    with Image(filename=image_path) as png:
-        percent_fuzz = int(png.quantum_range * fuzz / 100)
-        if transparency != "":
-            png.transparent_color(color=Color(transparency), alpha=alpha, fuzz=percent_fuzz)
-        if blur is not None:
-            png.blur(blur[0], blur[1])
-        if out_file == "":
-            out_file = in_file
-        png.save(filename=config.png_path + out_file + ".png")
-
-
-def add_pngs(in_file: str, in_list: List[str], out_file: str = "") -> None:
-    """Join PNGs on one another."""
-    if out_file == "":
-        out_file = in_file
-    with Image(filename=config.png_path + in_file + ".png") as png:
-        png.background_color = Color("transparent")
-        for file in in_list:
-            file_path = config.png_path + file + ".png"
-            if not os.path.exists(file_path):
-                continue
-            with Image(filename=file_path) as png2:
-                png2.transparent_color(color=Color("white"), alpha=0.0)
-                png.composite(image=png2, gravity="center")
-        png.save(filename=config.png_path + out_file + ".png")
-
-
-def prepare_silks(in_file: str, mask: str = "", out_file: str = "") -> None:
-    """Cutout mask areas + prepare transparent silks pngs + set silks alpha."""
-    if out_file == "":
-        out_file = in_file
-    with Image(filename=config.png_path + in_file + ".png") as png:
-        if mask != "":
-            with Image(filename=config.png_path + mask + ".png") as png2:
-                png2.colorize(color=Color("black"), alpha=Color(MASK_FG_COLOR))
-                png.composite(image=png2, gravity="center")
-        png.transparent_color(color=Color("black"), alpha=0.0)
-        levelize_matrix = [
-            [1, 0, 0, 0, 1],
-            [0, 1, 0, 0, 1],
-            [0, 0, 1, 0, 1],
-            [0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0.5],
-        ]
-        png.color_matrix(levelize_matrix)
-        png.save(filename=config.png_path + out_file + ".png")
+    percent_fuzz = int(png.quantum_range * fuzz / 100)
+    if transparency != "":
+        png.transparent_color(color=Color(transparency), alpha=alpha, fuzz=percent_fuzz)
+    if blur is not None:
+        png.blur(blur[0], blur[1])
+
+
+def add_png(png: Image, overlay: None | Image) -> None:
+    """Join image on another one. White areas of the overlay are made transparent in place."""
+    if overlay is None:
+        return
+    overlay.transparent_color(color=Color("white"), alpha=0.0)
+    png.composite(image=overlay, gravity="center")
+
+
+def prepare_silks(png: Image, mask: None | Image = None) -> None:
+    """Cutout mask areas + prepare transparent silks image + set silks alpha, done in place.
+
+    The mask image is recolored in place too.
+    """
+    if mask is not None:
+        mask.colorize(color=Color("black"), alpha=Color(MASK_FG_COLOR))
+        png.composite(image=mask, gravity="center")
+    png.transparent_color(color=Color("black"), alpha=0.0)
+    levelize_matrix = [
+        [1, 0, 0, 0, 1],
+        [0, 1, 0, 0, 1],
+        [0, 0, 1, 0, 1],
+        [0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0.5],
+    ]
+    png.color_matrix(levelize_matrix)
 
 
 def prepare_solder() -> None:
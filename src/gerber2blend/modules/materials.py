@@ -1,6 +1,7 @@
 """Module responsible for appending and preparing PCB shaders."""
 
 import bpy
+import numpy as np
 import os
 import math
 import gerber2blend.modules.config as config
@@ -21,154 +22,273 @@ from gerber2blend.modules.config import (
     OUT_B_SOLDER,
 )
 import logging
-from typing import List, Tuple
+from typing import Dict, List, Sequence, Set, Tuple
 
 logger = logging.getLogger(__name__)
 
+EDGE_MATERIALS = ["main_pcb_edge_gold", "main_pcb_edge_bare"]
+BOARD_MATERIALS = ["main_pcb_top", "main_pcb_bot", "main_pcb_inner"]
+SOLDER_MATERIAL = "Solder"
+# Image Texture node holding the copper texture in `main_pcb_inner` material
+INNER_CU_TEXTURE_NODE = "Image Texture.001"
+
+
+def _linearize(c: int) -> float:
+    """Convert 8-bit sRGB channel value to linear color."""
+    c_norm = c / 255
+    return c_norm / 12.92 if c_norm < 0.04045 else math.pow((c_norm + 0.055) / 1.055, 2.4)
+
+
+# sRGB to linear conversion for every 8-bit channel value
+_SRGB_LUT = tuple(_linearize(c) for c in range(256))
+
 
 def load_materials(mat_list: List[str]) -> None:
-    """Load materials from other blendfile using predefined list."""
-    imported_materials = fio.import_from_blendfile(config.mat_blend_path, "materials", lambda name: name in mat_list)
+    """Load materials from other blendfile using predefined list.
+
+    Materials that are already loaded are skipped, the blendfile is not opened if there is nothing left to load.
+    """
+    to_load = [name for name in mat_list if name not in bpy.data.materials]
+    if not to_load:
+        return
+    # Materials are appended, not linked: their node groups and images are edited in place (colors, texture paths)
+    # and the saved board blendfile has to be self-contained, without a reference to the materials library.
+    imported_materials = fio.import_from_blendfile(config.mat_blend_path, "materials", lambda name: name in to_load)
 
     for material in imported_materials:
-        logger.debug(f"Loading material {material}")
+        logger.debug("Loading material %s", material)
 
 
-def reload_textures(texture: str) -> None:
-    """Refresh image saved at filepath."""
+def reload_textures(textures: List[str], png_files: None | Set[str] = None) -> None:
+    """Refresh images saved at filepaths, in a single pass over loaded images.
+
+    Names of files in the PNG directory can be passed in `png_files` if the directory was already listed.
+    Raises RuntimeError if a texture image or its PNG file is missing.
+    """
+    if png_files is None:
+        png_files = list_png_files()
+    for texture in textures:
+        if texture not in png_files:
+            raise RuntimeError(f"Texture file {texture} not found in {config.png_path}")
+    debug = logger.isEnabledFor(logging.DEBUG)
+    wanted = set(textures)
     for image in bpy.data.images:
-        logger.debug(image.filepath)
-    bpy.data.images[texture].filepath = config.png_path + texture
-    logger.debug("Reloading textures: " + bpy.data.images[texture].filepath)
+        if debug:
+            logger.debug(image.filepath)
+        if image.name not in wanted:
+            continue
+        # setting the file path reloads the image
+        image.filepath = config.png_path + image.name
+        wanted.discard(image.name)
+        logger.debug("Reloading textures: %s", image.filepath)
+    if wanted:
+        raise RuntimeError(f"Texture images not found in loaded images: {', '.join(sorted(wanted))}")
 
 
-def append_material(obj: bpy.types.Object, mat: str) -> None:
-    """Append material to object's material slots."""
-    bpy.context.view_layer.objects.active = obj
-    obj.select_set(True)
-    used_mat = bpy.data.materials[mat]
+def list_png_files() -> Set[str]:
+    """List names of files in the PNG directory with a single directory scan."""
+    with os.scandir(config.png_path) as it:
+        return {entry.name for entry in it if entry.is_file()}
+
+
+def append_material(obj: bpy.types.Object, mat: str | bpy.types.Material) -> None:
+    """Append material (given by name or reference) to object's material slots.
+
+    Appending to mesh materials does not require the object to be active or selected, so neither is changed.
+    """
+    used_mat = bpy.data.materials[mat] if isinstance(mat, str) else mat
     assert isinstance(obj.data, bpy.types.Mesh)
     obj.data.materials.append(used_mat)
 
 
-def assign_material(obj: bpy.types.Object, mat_name: str, pos: str, vrts: None | List[Tuple[float]] = None) -> None:
-    """Assign material to a material slot."""
-    if vrts is None:
-        vrts = []
-    cu.face_desel(obj)
-    cu.face_sel(obj, pos, vrts)
-    bpy.context.object.active_material_index = find_idx(obj, mat_name)
-    bpy.ops.object.material_slot_assign()
-    if pos == "edge":  # smooth shading of board edges
-        bpy.ops.mesh.faces_shade_smooth()
-    cu.face_desel(obj)
-    bpy.ops.mesh.select_mode(type="VERT")
-    bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
-
-
-def find_idx(obj: bpy.types.Object, matname: str) -> int:
-    """Find object's material slot index occupied by material of specified name."""
-    for i in range(len(obj.material_slots)):
-        if obj.material_slots[i].name == matname:
-            return i
-    return 0
-
-
-def create_inner_layer_material(mat_name: str, png: str) -> None:
-    """Create inner copper layer shader."""
+def append_materials_bulk(obj: bpy.types.Object, mats: Sequence[str | bpy.types.Material]) -> None:
+    """Append materials (given by names or references) missing from object's material slots.
+
+    The object is not activated or selected.
+    """
+    assert isinstance(obj.data, bpy.types.Mesh)
+    slots = obj.data.materials
+    existing = {mat.name for mat in slots if mat}
+    for mat in mats:
+        used_mat = bpy.data.materials[mat] if isinstance(mat, str) else mat
+        if used_mat.name not in existing:
+            slots.append(used_mat)
+            existing.add(used_mat.name)
+
+
+def assign_materials(
+    obj: bpy.types.Object,
+    assignments: List[Tuple[str, str, Sequence[Tuple[float]]]],
+    idx_map: None | Dict[str, int] = None,
+) -> None:
+    """Assign materials to faces facing specified directions, given as (material name, pos, vertices) tuples.
+
+    Material indices of all assignments are written to mesh polygons at once in Object Mode, without
+    selecting faces or activating the object. Slot indices are taken from `idx_map` when given
+    (see _slot_index_map()), otherwise they are looked up.
+    """
+    assert isinstance(obj.data, bpy.types.Mesh)
+    mesh = obj.data
+    if idx_map is None:
+        idx_map = _slot_index_map(obj)
+
+    mat_indices = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", mat_indices)
+    smooth = None
+    for mat_name, pos, vrts in assignments:
+        faces = cu.faces_facing(mesh, pos, vrts)
+        idx = idx_map.get(mat_name, -1)
+        if idx == -1:
+            raise RuntimeError(f"Material {mat_name} not found in material slots of {obj.name}")
+        mat_indices[faces] = idx
+        if pos == "edge":  # smooth shading of board edges
+            if smooth is None:
+                smooth = np.empty(len(mesh.polygons), dtype=bool)
+                mesh.polygons.foreach_get("use_smooth", smooth)
+            smooth[faces] = True
+    mesh.polygons.foreach_set("material_index", mat_indices)
+    if smooth is not None:
+        mesh.polygons.foreach_set("use_smooth", smooth)
+    mesh.update()
+
+
+def _slot_index_map(obj: bpy.types.Object) -> Dict[str, int]:
+    """Map names of object's material slots to their indices."""
+    # walk slots in reverse so that the first slot with matching name wins
+    return {slot.name: i for i, slot in reversed(list(enumerate(obj.material_slots)))}
+
+
+def create_inner_layer_material(mat_name: str, png: str) -> bpy.types.Material:
+    """Create inner copper layer shader.
+
+    The material is a copy of `main_pcb_inner` with its own copper texture. Node groups used by the material
+    are shared between copies, only the top level node tree is duplicated.
+    """
     in_mat = bpy.data.materials.get("main_pcb_inner")
     assert in_mat is not None, "Failed to load `main_pcb_inner` material"
     in_copy = in_mat.copy()
     in_copy.name = mat_name
     # update Cu texture
-    image_cu = in_copy.node_tree.nodes["Image Texture.001"]  # type:ignore [attr-defined]
-    bpy.ops.image.open(filepath=config.png_path + png)
-    image_cu.image = bpy.data.images[png]
-
-
-def to_blender_color(c: float) -> float:
-    """Convert RGB to Blender gamma corrected color."""
-    c = min(max(0, c), 255) / 255
-    return c / 12.92 if c < 0.04045 else math.pow((c + 0.055) / 1.055, 2.4)
+    image_cu = in_copy.node_tree.nodes[INNER_CU_TEXTURE_NODE]  # type:ignore [attr-defined]
+    image_cu.image = bpy.data.images.load(config.png_path + png, check_existing=True)
+    return in_copy
 
 
 def hex_to_rgba(hex_value: int | str, alpha: float) -> Tuple[float, float, float, float]:
     """Convert color hex value to RGBA format."""
     if isinstance(hex_value, str):
         hex_value = int(hex_value, 16)
-        # hex_value = hex(hex_value)
-    b = to_blender_color((hex_value & 0xFF))
-    g = to_blender_color((hex_value >> 8) & 0xFF)
-    r = to_blender_color((hex_value >> 16) & 0xFF)
-    return (r, g, b, alpha)
-
-
-def set_soldermask_color(soldermask_color: Tuple[str, str]) -> None:
+    return (
+        _SRGB_LUT[(hex_value >> 16) & 0xFF],
+        _SRGB_LUT[(hex_value >> 8) & 0xFF],
+        _SRGB_LUT[hex_value & 0xFF],
+        alpha,
+    )
+
+
+# Preset colors converted to RGBA once at import
+# Soldermask presets: (color for masked RGB node, color for unmasked RGB node)
+SOLDERMASK_PRESETS = {
+    name: (hex_to_rgba(masked, 1.0), hex_to_rgba(unmasked, 1.0))
+    for name, (masked, unmasked) in {
+        "Black": (0x211918, 0x150E02),
+        "White": (0xFFFFFF, 0x9A9393),
+        "Green": (0x027029, 0x073E14),
+        "Blue": (0x02346D, 0x102141),
+        "Red": (0xD01B10, 0x83140B),
+    }.items()
+}
+SILKSCREEN_PRESETS = {name: hex_to_rgba(color, 1.0) for name, color in {"Black": 0x000000, "White": 0xB3BEC2}.items()}
+
+
+def set_soldermask_color(soldermask_color: Tuple[str, str], color_nodes: None | bpy.types.Nodes = None) -> None:
     """Set color of soldermask shader node.
 
     Preset or pair of hex values - first value for masked RGB node, second value for unmasked RGB node.
+    Nodes of the `Color_group` node group can be passed in `color_nodes` if they were already looked up.
     """
-    colors_dict = {
-        "Black": [0x211918, 0x150E02],
-        "White": [0xFFFFFF, 0x9A9393],
-        "Green": [0x027029, 0x073E14],
-        "Blue": [0x02346D, 0x102141],
-        "Red": [0xD01B10, 0x83140B],
-    }
-    masked_color_val: int = 0
     if len(soldermask_color) == 2:  # custom colors
-        masked_color_val = int(soldermask_color[0], 16)
-        unmasked_color_val = int(soldermask_color[1], 16)
+        masked_color = hex_to_rgba(soldermask_color[0], 1.0)
+        unmasked_color = hex_to_rgba(soldermask_color[1], 1.0)
     else:
-        [masked_color_val, unmasked_color_val] = colors_dict[soldermask_color[0]]  # preset color used
+        masked_color, unmasked_color = SOLDERMASK_PRESETS[soldermask_color[0]]  # preset color used
 
-    masked_color_node = bpy.data.node_groups["Color_group"].nodes["Masked_Color"]
-    unmasked_color_node = bpy.data.node_groups["Color_group"].nodes["Unmasked_Color"]
+    if color_nodes is None:
+        color_nodes = bpy.data.node_groups["Color_group"].nodes
+    masked_color_node = color_nodes["Masked_Color"]
+    unmasked_color_node = color_nodes["Unmasked_Color"]
 
-    masked_color_node.outputs[0].default_value = hex_to_rgba(masked_color_val, 1.0)  # type: ignore
-    unmasked_color_node.outputs[0].default_value = hex_to_rgba(unmasked_color_val, 1.0)  # type: ignore
+    set_socket_color(masked_color_node.outputs[0], masked_color)
+    set_socket_color(unmasked_color_node.outputs[0], unmasked_color)
 
 
-def set_silkscreen_color(silk_color: str) -> None:
-    """Set color of silkscreen shader node (black or white)."""
-    colors_dict = {"Black": 0x000000, "White": 0xB3BEC2}
-    mix_node = bpy.data.node_groups["Color_group"].nodes["Mix"]
-    mix_node.inputs["A"].default_value = hex_to_rgba(colors_dict[silk_color[0]], 1.0)  # type: ignore
+def set_silkscreen_color(silk_color: str, color_nodes: None | bpy.types.Nodes = None) -> None:
+    """Set color of silkscreen shader node (black or white).
+
+    Nodes of the `Color_group` node group can be passed in `color_nodes` if they were already looked up.
+    """
+    if color_nodes is None:
+        color_nodes = bpy.data.node_groups["Color_group"].nodes
+    mix_node = color_nodes["Mix"]
+    set_socket_color(mix_node.inputs["A"], SILKSCREEN_PRESETS[silk_color[0]])
+
+
+def set_socket_color(socket: bpy.types.NodeSocket, color: Tuple[float, float, float, float]) -> None:
+    """Set color of shader node socket, skipping the write if the color is already set.
+
+    Any write to node values triggers shader recompilation, even if the value does not change.
+    """
+    current = tuple(socket.default_value)  # type: ignore
+    if len(current) != len(color):
+        socket.default_value = color  # type: ignore
+        return
+    if all(math.isclose(a, b, abs_tol=1e-6) for a, b in zip(current, color, strict=True)):
+        return
+    socket.default_value = color  # type: ignore
 
 
 def process_edge_materials(
     pcb: bpy.types.Object, plated_verts: List[Tuple[float]], bare_verts: List[Tuple[float]]
 ) -> None:
     """Assign gold or edge material to model sides."""
-    materials = ["main_pcb_edge_gold", "main_pcb_edge_bare"]
+    materials = list(EDGE_MATERIALS)
     load_materials(materials)
+    resolved = {name: bpy.data.materials[name] for name in materials}
 
-    for material in materials:
-        append_material(pcb, material)
+    append_materials_bulk(pcb, list(resolved.values()))
 
-    assign_material(pcb, "main_pcb_edge_gold", "edge", plated_verts)
-    assign_material(pcb, "main_pcb_edge_bare", "edge", bare_verts)
+    idx_map = _slot_index_map(pcb)
+    assign_materials(
+        pcb,
+        [
+            (resolved["main_pcb_edge_gold"].name, "edge", plated_verts),
+            (resolved["main_pcb_edge_bare"].name, "edge", bare_verts),
+        ],
+        idx_map,
+    )
 
 
 def process_materials(board_col: bpy.types.Collection, in_list: List[str]) -> None:
     """Assign top and bottom materials to model."""
-    materials = ["main_pcb_top", "main_pcb_bot", "main_pcb_inner"]
+    materials = list(BOARD_MATERIALS)
     load_materials(materials)
+    # materials are resolved once and used by reference from now on
+    resolved = {name: bpy.data.materials[name] for name in materials}
 
     # Set different color of soldermask
-    set_soldermask_color(config.blendcfg["SETTINGS"]["SOLDERMASK"])
-    set_silkscreen_color(config.blendcfg["SETTINGS"]["SILKSCREEN"])
+    color_nodes = bpy.data.node_groups["Color_group"].nodes
+    set_soldermask_color(config.blendcfg["SETTINGS"]["SOLDERMASK"], color_nodes)
+    set_silkscreen_color(config.blendcfg["SETTINGS"]["SILKSCREEN"], color_nodes)
 
+    # list the PNG directory once, instead of checking every texture file separately
+    png_files = list_png_files()
     with Color("white") as bg:
         with Image(width=100, height=100, background=bg) as img:
             # white image as OUT_*_SOLDER will not introduce changes in texture color
-            fsolder = config.png_path + OUT_F_SOLDER + ".png"
-            if not os.path.exists(fsolder):
-                img.save(filename=fsolder)
-            bsolder = config.png_path + OUT_B_SOLDER + ".png"
-            if not os.path.exists(bsolder):
-                img.save(filename=bsolder)
+            for solder in [f"{OUT_F_SOLDER}.png", f"{OUT_B_SOLDER}.png"]:
+                if solder not in png_files:
+                    img.save(filename=config.png_path + solder)
+                    png_files.add(solder)
 
     textures = [
         f"{OUT_F_DISPMAP}.png",
@@ -187,36 +307,57 @@ def process_materials(board_col: bpy.types.Collection, in_list: List[str]) -> No
     if config.blendcfg["EFFECTS"]["STACKUP"]:
         for i, png in enumerate(in_list):
             mat_name = "main_pcb_inner" + str(i + 1)
-            create_inner_layer_material(mat_name, png)
+            resolved[mat_name] = create_inner_layer_material(mat_name, png)
             layers_materials.append(mat_name)
-            materials.append(mat_name)
 
     layers_materials += ["main_pcb_top"]
 
     # update paths to pngs
-    for t in textures:
-        reload_textures(t)
+    reload_textures(textures, png_files)
     # assign materials to PCB layers
+    layers_materials_refs = [resolved[name] for name in layers_materials]
     for i, board_layer in enumerate(board_col.objects):
-        append_material(board_layer, layers_materials[i])
-        append_material(board_layer, layers_materials[i + 1])
-        assign_material(board_layer, layers_materials[i], "bot")
-        assign_material(board_layer, layers_materials[i + 1], "top")
+        bot_mat, top_mat = layers_materials_refs[i : i + 2]
+        append_materials_bulk(board_layer, [bot_mat, top_mat])
+        idx_map = _slot_index_map(board_layer)
+        assign_materials(board_layer, [(bot_mat.name, "bot", ()), (top_mat.name, "top", ())], idx_map)
 
 
 def clear_empty_material_slots() -> None:
-    """Clear empty slots in all objects on scene."""
+    """Clear empty slots in all objects on scene.
+
+    Slots are rebuilt at once instead of removing them one by one. Faces assigned to a removed slot
+    are moved to the previous kept slot, same as with the `material_slot_remove` operator.
+    """
     for obj in bpy.data.collections["Board"].all_objects:
-        bpy.context.view_layer.objects.active = obj
-        for slot in obj.material_slots:
-            if not slot.material:
-                bpy.context.object.active_material_index = slot.slot_index
-                bpy.ops.object.material_slot_remove()
+        mesh = obj.data
+        if not isinstance(mesh, bpy.types.Mesh):
+            continue
+        mats = mesh.materials
+        # most objects have no empty slots, stop at the first empty one found
+        if all(mat is not None for mat in mats):
+            continue
+        keep = [mat is not None for mat in mats]
+
+        # new index of each old slot: number of kept slots before it, minus one for removed slots
+        kept_before = np.cumsum(keep) - np.array(keep, dtype=np.int32)
+        remap = np.where(keep, kept_before, np.maximum(kept_before - 1, 0)).astype(np.int32)
+        mat_indices = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get("material_index", mat_indices)
+        if len(mat_indices):
+            mat_indices = remap[np.minimum(mat_indices, len(remap) - 1)]
+
+        kept_mats = [mat for mat in mats if mat is not None]
+        mats.clear()
+        for mat in kept_mats:
+            mats.append(mat)
+        mesh.polygons.foreach_set("material_index", mat_indices)
+        mesh.update()
 
 
 def clear_and_set_solder_material(obj: bpy.types.Object) -> None:
     """Clear all materials and add solder material instead."""
     obj.data.materials.clear()  # type:ignore
-    material = "Solder"
+    material = SOLDER_MATERIAL
     load_materials([material])
     append_material(obj, material)
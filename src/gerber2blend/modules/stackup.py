@@ -67,7 +67,7 @@ def _parse_stackup_from_file(file_path: str) -> Tuple[float, List[Tuple[str, flo
         [1]: List of PCB name <-> thickness pairs
 
     """
-    stackup_data = []
+    stackup_data: List[Tuple[str, float, str]] = []
     calculated_thickness = config.blendcfg["SETTINGS"]["DEFAULT_BRD_THICKNESS"]
 
     try:
@@ -75,19 +75,19 @@ def _parse_stackup_from_file(file_path: str) -> Tuple[float, List[Tuple[str, flo
         if not os.path.exists(file_path):
             logger.warning("Error while reading stackup.json!")
         else:
-            with open(file_path) as stackup_json_file:
+            # json decodes UTF-8 bytes directly, skipping the text layer
+            with open(file_path, "rb") as stackup_json_file:
                 stackup_json_data = json.load(stackup_json_file)
 
-            stackup_data = [
-                (layer["name"], layer["thickness"], layer["user-name"]) for layer in stackup_json_data["layers"]
-            ]
             calculated_thickness = 0.0
             for layer in stackup_json_data["layers"]:
-                if layer["thickness"] is not None:
-                    calculated_thickness += float(layer["thickness"])
+                thickness = layer["thickness"]
+                stackup_data.append((layer["name"], thickness, layer["user-name"]))
+                if thickness is not None:
+                    calculated_thickness += float(thickness)
 
-            logger.debug("Found stackup data: " + str(stackup_data))
-            logger.debug("Calculated thickness: " + str(calculated_thickness))
+            logger.debug("Found stackup data: %s", stackup_data)
+            logger.debug("Calculated thickness: %s", calculated_thickness)
     except Exception as e:
         logger.warning("Error while reading stackup.json!", exc_info=True)
         raise RuntimeError("Could not read stackup.json") from e